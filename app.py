@@ -3,8 +3,12 @@ import streamlit as st
 import base64
 from rag import get_answer, LANGUAGE_CONFIGS, openai_client
 from tts import text_to_speech
+from prefetch import StoryPrefetcher, MAX_SPECULATIVE_CALLS
+from session_store import get_session_store, remove_session_audio
 from streamlit_mic_recorder import mic_recorder
 import io
+import re
+import secrets
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(page_title="Sparky AI Tutor", page_icon="🤖", layout="centered")
@@ -69,35 +73,85 @@ def send_message(user_text=None):
     text_to_send = user_text if user_text is not None else st.session_state.get('user_input', '')
     text_to_send = text_to_send.strip()
     if text_to_send:
-        st.session_state.messages.append({"role": "user", "content": text_to_send})
+        answer_kwargs = dict(
+            grade=st.session_state.selected_grade, subject=st.session_state.selected_subject,
+            lang=st.session_state.selected_lang_code, child_name=st.session_state.child_name,
+            app_mode=st.session_state.app_mode
+        )
+        session = get_session_store().get(get_session_id()) or {}
+        messages = [*session.get("messages", []), {"role": "user", "content": text_to_send}]
+        prefetcher = get_story_prefetcher()
         with st.spinner("Sparky is thinking... 🤔"):
-            result = get_answer(
-                messages=st.session_state.messages, grade=st.session_state.selected_grade,
-                subject=st.session_state.selected_subject, lang=st.session_state.selected_lang_code,
-                child_name=st.session_state.child_name, app_mode=st.session_state.app_mode
-            )
-        st.session_state.messages.append({ "role": "assistant", "content": result["answer"], "image_url": result["image_url"], "choices": result["choices"] })
-        if result["answer"]:
-            try:
-                audio_file_path = text_to_speech(result["answer"], lang=st.session_state.selected_lang_code)
-                with open(audio_file_path, "rb") as audio_file: st.session_state.audio_to_play = audio_file.read()
-            except Exception: st.session_state.audio_to_play = None
+            prefetched = prefetcher.take(text_to_send, **answer_kwargs)
+            if prefetched: result, audio_path = prefetched
+            else: result, audio_path = get_answer(messages=messages, **answer_kwargs), None
+        # The speculation budget belongs to the child (sid), so a reload doesn't reset it.
+        prefetch_spent = session.get("prefetch_spent", 0) - prefetcher.pop_refunds()
+        if not audio_path and result["answer"]:
+            try: audio_path = text_to_speech(result["answer"], lang=st.session_state.selected_lang_code)
+            except Exception: audio_path = None
+        messages.append({ "role": "assistant", "content": result["answer"], "image_url": result["image_url"], "choices": result["choices"], "audio_path": audio_path })
+        st.session_state.audio_to_play = audio_path
+        if st.session_state.app_mode == "Story Mode" and result["choices"]:
+            # Generate every branch in the background while the child reads, so the click is instant.
+            prefetch_spent += prefetcher.start(list(messages), result["choices"], budget=MAX_SPECULATIVE_CALLS - prefetch_spent, **answer_kwargs)
         st.session_state.user_input = ""
+        st.session_state.saved_session = save_session({**session, "messages": messages, "prefetch_spent": max(prefetch_spent, 0)})
+
+def get_story_prefetcher():
+    if 'story_prefetcher' not in st.session_state:
+        st.session_state.story_prefetcher = StoryPrefetcher()
+    return st.session_state.story_prefetcher
 
 def reset_conversation():
     name = st.session_state.get('child_name'); mode = st.session_state.get('app_mode'); lang_code = st.session_state.get('selected_lang_code')
     grade = st.session_state.get('selected_grade'); subject = st.session_state.get('selected_subject')
+    prefetcher = st.session_state.get('story_prefetcher')
+    if prefetcher: prefetcher.cancel()
     st.session_state.clear()
+    if prefetcher: st.session_state.story_prefetcher = prefetcher
     st.session_state.child_name = name; st.session_state.app_mode = mode; st.session_state.selected_lang_code = lang_code
     st.session_state.selected_grade = grade; st.session_state.selected_subject = subject
-    st.session_state.messages = []
+    session = get_session_store().get(get_session_id()) or {}
+    remove_session_audio(session)
+    prefetch_spent = session.get("prefetch_spent", 0) - (prefetcher.pop_refunds() if prefetcher else 0)
+    st.session_state.saved_session = save_session({**session, "messages": [], "prefetch_spent": max(prefetch_spent, 0)})
     st.rerun()
 
-def initialize_chat_messages():
-    if st.session_state.app_mode == "Tutor Mode":
-        st.session_state.messages = [{"role": "assistant", "content": f"Hi {st.session_state.child_name}! I'm Sparky! 🤖 What do you want to learn about today?"}]
-    else:
-        st.session_state.messages = []
+# --- SESSION STORE ---
+# The session store is the source of truth for the conversation. st.session_state only
+# holds widget values and transient state; history is read from the store once per run.
+PROFILE_KEYS = ["child_name", "app_mode", "lang_select", "selected_lang_code", "selected_grade", "selected_subject"]
+
+# The sid is the only credential for a session, so only accept long random tokens.
+SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{32,}$")
+
+def get_session_id():
+    if not SESSION_ID_RE.match(st.query_params.get("sid", "")): st.query_params["sid"] = secrets.token_urlsafe(32)
+    return st.query_params["sid"]
+
+def load_session():
+    """
+    Returns this run's session data. A callback that just saved the session hands
+    it over in saved_session, so the store is read at most once per run.
+    """
+    data = st.session_state.pop("saved_session", None) or get_session_store().get(get_session_id()) or {}
+    if not st.session_state.get("session_loaded"):
+        for key in PROFILE_KEYS:
+            if key in data and key not in st.session_state: st.session_state[key] = data[key]
+        st.session_state.session_loaded = True
+    return data
+
+def save_session(data):
+    data = {**data, **{key: st.session_state[key] for key in PROFILE_KEYS if key in st.session_state}}
+    get_session_store().put(get_session_id(), data)
+    return data
+
+def initialize_chat_messages(session):
+    if st.session_state.app_mode != "Tutor Mode": return []
+    messages = [{"role": "assistant", "content": f"Hi {st.session_state.child_name}! I'm Sparky! 🤖 What do you want to learn about today?"}]
+    save_session({**session, "messages": messages})
+    return messages
 
 def display_chat_message(msg):
     is_user = msg["role"] == "user"; avatar = "🧑‍🚀" if is_user else "🤖"
@@ -118,13 +172,15 @@ def display_chat_message(msg):
 is_embedded = st.query_params.get("embed") == "true"
 if is_embedded: apply_embed_styling()
 else: apply_standalone_styling("./assets/background.png")
+session = load_session()
 
 if 'child_name' not in st.session_state:
     if not is_embedded: st.title("🚀 Welcome!")
     st.subheader("What should Sparky call you?")
     name = st.text_input("My name is...", label_visibility="collapsed")
     if name:
-        st.session_state.child_name = name; st.session_state.app_mode = "Tutor Mode"; st.session_state.messages = []
+        st.session_state.child_name = name; st.session_state.app_mode = "Tutor Mode"
+        save_session({**session, "messages": []})
         st.rerun()
 else:
     if is_embedded:
@@ -137,28 +193,37 @@ else:
         # The old diagnostic line that caused the crash has been removed.
         st.radio("Choose a mode:", ["Tutor Mode", "Story Mode"], key="app_mode", on_change=reset_conversation)
         language_options = { f"{config['name']} ({config['english_name']})" if code != 'en' else config['name']: code for code, config in LANGUAGE_CONFIGS.items() }
+        # Drop restored values that are no longer valid options before the widgets are created.
+        if st.session_state.get("lang_select") not in language_options: st.session_state.pop("lang_select", None)
         selected_display_name = st.selectbox("Select Language", options=language_options.keys(), key="lang_select")
         st.session_state.selected_lang_code = language_options[selected_display_name]
-        grades = list_grades(); st.session_state.selected_grade = st.selectbox("Select Grade", grades) if grades else None
-        subjects = list_subjects(st.session_state.selected_grade); st.session_state.selected_subject = st.selectbox("Select Subject", subjects) if subjects else None
+        grades = list_grades()
+        if st.session_state.get("selected_grade") not in grades: st.session_state.pop("selected_grade", None)
+        if grades: st.selectbox("Select Grade", grades, key="selected_grade")
+        else: st.session_state.selected_grade = None
+        subjects = list_subjects(st.session_state.selected_grade)
+        if st.session_state.get("selected_subject") not in subjects: st.session_state.pop("selected_subject", None)
+        if subjects: st.selectbox("Select Subject", subjects, key="selected_subject")
+        else: st.session_state.selected_subject = None
         st.button("🚀 Start New Chat!", on_click=reset_conversation, use_container_width=True)
 
     chat_container = st.container(height=380)
-    if not st.session_state.get("messages"): initialize_chat_messages()
-    if st.session_state.app_mode == "Story Mode" and not st.session_state.messages:
+    messages = session.get("messages") or initialize_chat_messages(session)
+    if st.session_state.app_mode == "Story Mode" and not messages:
         if st.session_state.selected_subject:
             prompt = f"Let's start an adventure about {st.session_state.selected_subject}!"
             send_message(user_text=prompt); st.rerun()
         else: chat_container.warning("Please select a subject to start a story!")
             
     with chat_container:
-        for msg in st.session_state.messages:
+        for msg in messages:
             if msg["role"] in ["user", "assistant"]: display_chat_message(msg)
 
     if st.session_state.get("audio_to_play"):
-        st.audio(st.session_state.audio_to_play, autoplay=True); st.session_state.audio_to_play = None
+        if os.path.exists(st.session_state.audio_to_play): st.audio(st.session_state.audio_to_play, format="audio/mpeg", autoplay=True)
+        st.session_state.audio_to_play = None
 
-    last_message = st.session_state.messages[-1] if st.session_state.messages else {}
+    last_message = messages[-1] if messages else {}
     if last_message.get("choices"):
         st.markdown("##### What happens next?")
         cols = st.columns(len(last_message["choices"]))
@@ -0,0 +1,113 @@
+# prefetch.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from rag import get_answer
+from tts import text_to_speech
+
+# --- COST CAPS ---
+MAX_CHOICES_PER_TURN = 3                      # never speculate on more branches than the story offers
+PREFETCH_WORKERS = 3 * MAX_CHOICES_PER_TURN   # process-wide cap on concurrent speculative calls
+MAX_SPECULATIVE_CALLS = 30                    # per-child budget, kept in the session store by the caller
+
+# One pool for every session in the process, so speculation never adds threads per child.
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="story-prefetch")
+
+
+class StoryPrefetcher:
+    """
+    Speculatively generates (and TTS-renders) the Story Mode continuation for
+    the offered choices while the child is still reading.
+
+    Branches run side by side while the shared pool has room. Under load a
+    branch may still be queued when it is clicked; it is then cancelled and
+    the caller answers synchronously. Queued branches cost nothing when
+    cancelled and are refunded to the child's budget. An LLM call that has
+    already started cannot be aborted, so a losing branch that is running
+    still finishes, but its TTS is skipped and its audio deleted.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._answer_kwargs = {}
+        self._refunds = 0
+
+    def start(self, messages, choices, budget, **answer_kwargs):
+        """
+        Cancels the previous turn's speculation and queues one background
+        get_answer + TTS job per choice, at most `budget` of them. Returns the
+        number queued, which the caller charges to the child's budget.
+        """
+        self.cancel()
+        self._answer_kwargs = answer_kwargs
+        for choice in choices[:max(0, min(budget, MAX_CHOICES_PER_TURN))]:
+            branch = [*messages, {"role": "user", "content": choice}]
+            cancelled = threading.Event()
+            self._futures[choice] = (_executor.submit(_generate, branch, cancelled, answer_kwargs), cancelled)
+        return len(self._futures)
+
+    def take(self, choice, **answer_kwargs):
+        """
+        Returns (result, audio_path) for a prefetched choice, waiting for it if
+        already running. Returns None if the choice was never started, was
+        generated with different settings, or failed, so the caller should
+        answer synchronously. The other branches are cancelled.
+        """
+        future, cancelled = self._futures.pop(choice, (None, None))
+        self.cancel()
+        if future is None:
+            return None
+        if answer_kwargs != self._answer_kwargs or not future.running() and not future.done():
+            self._discard(future, cancelled)
+            return None
+        try:
+            generated = future.result()
+        except Exception:
+            generated = None
+        if not generated or generated[0].get("error"):
+            self._discard(future, cancelled)
+            return None
+        return generated
+
+    def cancel(self):
+        for future, cancelled in self._futures.values():
+            self._discard(future, cancelled)
+        self._futures = {}
+
+    def pop_refunds(self):
+        """
+        Returns how many queued branches were cancelled before calling the LLM
+        since the last call, so the caller can give them back to the budget.
+        """
+        refunds, self._refunds = self._refunds, 0
+        return refunds
+
+    def _discard(self, future, cancelled):
+        """
+        Stops a branch and deletes its audio file once the job has finished.
+        """
+        cancelled.set()
+        if future.cancel():
+            self._refunds += 1
+        future.add_done_callback(_remove_branch_audio)
+
+
+def _generate(messages, cancelled, answer_kwargs):
+    if cancelled.is_set():
+        return None
+    result = get_answer(messages=messages, show_errors=False, **answer_kwargs)
+    if cancelled.is_set() or result.get("error") or not result["answer"]:
+        return result, None
+    try:
+        audio_path = text_to_speech(result["answer"], lang=answer_kwargs["lang"])
+    except Exception:
+        audio_path = None
+    return result, audio_path
+
+
+def _remove_branch_audio(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    generated = future.result()
+    if generated and generated[1] and os.path.exists(generated[1]):
+        os.remove(generated[1])
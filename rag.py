@@ -27,6 +27,9 @@ groq_client = Groq(api_key=groq_api_key) if groq_api_key else None
 # --- CONSTANTS AND CONFIGS ---
 INDEX_NAME = "educade-prod-db"
 embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Story Mode output parsing; tolerates markdown like "**Choice 1:**" and "Choice 1 - ..."
+CHOICE_LINE_RE = re.compile(r"^\W*Choice\s*\d+\s*\W*[:.)-]\s*(.+)", re.IGNORECASE)
+STORY_LABEL_RE = re.compile(r"^[\s*_]*Story\s*:[*_]*\s*", re.IGNORECASE)
 
 # --- FINAL LANGUAGE CONFIGURATION (Simplified for the two-step chain) ---
 LANGUAGE_CONFIGS = {
@@ -50,17 +53,51 @@ LANGUAGE_CONFIGS = {
 }
 
 # --- MAIN RAG FUNCTION (Completely Rewritten for Tutor Mode) ---
-def get_answer(messages, grade, subject, lang, child_name, app_mode):
+def get_answer(messages, grade, subject, lang, child_name, app_mode, show_errors=True):
+    """
+    Failed calls return a friendly fallback answer with "error": True.
+    Pass show_errors=False when calling outside the Streamlit script thread.
+    """
     if not pc or not groq_client:
-        return {"answer": "Error: App is not configured. Please check API Keys.", "image_url": None, "choices": None}
+        return {"answer": "Error: App is not configured. Please check API Keys.", "image_url": None, "choices": None, "error": True}
     
     user_message = messages[-1]["content"]
     final_answer, image_url, choices = "", None, None
     
     try:
         if app_mode == "Story Mode":
-            # Story mode logic is correct and remains the same
-            pass 
+            config = LANGUAGE_CONFIGS.get(lang, LANGUAGE_CONFIGS["en"])
+            story_system_prompt = f"""
+            You are Sparky, a cheerful robot storyteller for a child named {child_name}.
+            Tell a short, fun, interactive adventure story about {subject} for a child in {grade}.
+            Each turn, write the next part of the story in 3 or 4 short sentences, then offer exactly three choices.
+            Your story MUST be in {config['name']}. Use emojis.
+            Keep the labels "Story:", "Choice 1:", "Choice 2:" and "Choice 3:" exactly as written here, in English, even when the story is in another language.
+
+            Story: [The next part of the story]
+            Choice 1: [A short choice, max 6 words]
+            Choice 2: [A short choice, max 6 words]
+            Choice 3: [A short choice, max 6 words]
+            """
+            cleaned_history = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+            story_completion = groq_client.chat.completions.create(
+                model="llama3-70b-8192",
+                messages=[{"role": "system", "content": story_system_prompt}, *cleaned_history],
+                temperature=0.8
+            )
+            story_text = story_completion.choices[0].message.content
+
+            choices, story_lines = [], []
+            for line in story_text.splitlines():
+                choice_match = CHOICE_LINE_RE.match(line)
+                if choice_match:
+                    choice = choice_match.group(1).strip(" *_")
+                    if choice: choices.append(choice)
+                else:
+                    story_lines.append(line)
+            final_answer = STORY_LABEL_RE.sub("", "\n".join(story_lines), count=1).strip()
+            return {"answer": final_answer, "image_url": None, "choices": choices[:3] or None}
         else: # Tutor Mode - The New Two-Step Logic
             index = pc.Index(INDEX_NAME)
             question_vector = embeddings.embed_query(user_message)
@@ -131,5 +168,5 @@ def get_answer(messages, grade, subject, lang, child_name, app_mode):
         return {"answer": final_answer, "image_url": None, "choices": None}
 
     except Exception as e:
-        st.error(f"Oh no! Sparky had a problem. Please tell the owner this: {e}")
-        return {"answer": "I'm having a little trouble thinking right now.", "image_url": None, "choices": None}
\ No newline at end of file
+        if show_errors: st.error(f"Oh no! Sparky had a problem. Please tell the owner this: {e}")
+        return {"answer": "I'm having a little trouble thinking right now.", "image_url": None, "choices": None, "error": True}
\ No newline at end of file
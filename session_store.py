@@ -0,0 +1,150 @@
+# session_store.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# --- LIMITS ---
+MAX_HISTORY = 50            # messages kept per session
+SESSION_TTL = 24 * 60 * 60  # seconds a session lives without activity
+MAX_SESSIONS = 1000         # in-memory LRU size
+
+
+def trim_session(data: dict) -> dict:
+    """
+    Keeps only the last MAX_HISTORY messages so a session's size is bounded.
+    Audio is stored as a file path on each message, never as bytes; files of
+    the dropped messages are deleted.
+    """
+    data = dict(data)
+    messages = list(data.get("messages") or [])
+    remove_session_audio({"messages": messages[:-MAX_HISTORY]})
+    data["messages"] = messages[-MAX_HISTORY:]
+    return data
+
+
+def remove_session_audio(data: dict):
+    """
+    Deletes the audio files referenced by a session's messages.
+    """
+    for msg in data.get("messages") or []:
+        if msg.get("audio_path"):
+            try:
+                os.remove(msg["audio_path"])
+            except OSError:
+                pass
+
+
+class InMemorySessionStore:
+    """
+    Process-local store with LRU and TTL eviction. Default backend.
+    Holds the session dicts themselves, so this is the only in-process copy.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL):
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated, data = entry
+            if time.time() - updated > self.ttl:
+                del self._sessions[session_id]
+                remove_session_audio(data)
+                return None
+            self._sessions.move_to_end(session_id)
+            return {**data, "messages": list(data["messages"])}
+
+    def put(self, session_id, data):
+        data = trim_session(data)
+        with self._lock:
+            self._sessions[session_id] = (time.time(), data)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                remove_session_audio(self._sessions.popitem(last=False)[1][1])
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry:
+            remove_session_audio(entry[1])
+
+
+class SQLiteSessionStore:
+    """
+    File-backed store, so sessions survive restarts and can be shared by
+    several app processes pointing at the same database file.
+    """
+
+    def __init__(self, path: str = "sessions.db", ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    @contextmanager
+    def _connect(self):
+        """
+        Yields a connection that commits on success and is always closed.
+        """
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id, data):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sessions (id, data, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                (session_id, json.dumps(trim_session(data)), now)
+            )
+            expired = conn.execute("SELECT data FROM sessions WHERE updated < ?", (now - self.ttl,)).fetchall()
+            conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl,))
+        for row in expired:
+            remove_session_audio(json.loads(row[0]))
+
+    def delete(self, session_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        if row:
+            remove_session_audio(json.loads(row[0]))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """
+    Returns the process-wide store chosen by SESSION_STORE ("memory" or "sqlite").
+    The SQLite file path comes from SESSION_DB_PATH.
+    """
+    global _store
+    # Streamlit runs each session's script in its own thread, so creation must be guarded.
+    with _store_lock:
+        if _store is None:
+            if os.getenv("SESSION_STORE", "memory") == "sqlite":
+                _store = SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"))
+            else:
+                _store = InMemorySessionStore()
+    return _store
@@ -1,18 +1,40 @@
 # tts.py
 import os
+import time
 import uuid
 from gtts import gTTS
 from pathlib import Path
 
 AUDIO_DIR = Path("audio")
 AUDIO_DIR.mkdir(exist_ok=True)
+AUDIO_MAX_AGE = 24 * 60 * 60  # seconds; matches the session TTL
+SWEEP_INTERVAL = 60 * 60
+_last_sweep = 0.0
 
 def text_to_speech(text: str, lang: str = "en") -> str:
     """
     Returns relative path to saved mp3 file.
     """
+    sweep_audio()
     fname = f"answer_{uuid.uuid4().hex[:8]}.mp3"
     path = AUDIO_DIR / fname
     tts = gTTS(text=text, lang=lang, slow=False)
     tts.save(str(path))
     return str(path)
+
+def sweep_audio(max_age: float = AUDIO_MAX_AGE):
+    """
+    Deletes answer files older than max_age, at most once per SWEEP_INTERVAL.
+    Catches files no session references any more, e.g. abandoned prefetches.
+    """
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    for path in AUDIO_DIR.glob("answer_*.mp3"):
+        try:
+            if now - path.stat().st_mtime > max_age:
+                path.unlink()
+        except OSError:
+            pass